@@ -1,83 +1,306 @@
-import io, re, datetime, urllib.parse, os
+import datetime, hashlib, json, os, re
 import streamlit as st
-from PyPDF2 import PdfReader
+try:
+    import re2  # google-re2: linear-time DFA matching for the field scan only
+except ImportError:
+    re2 = re
 
 # --- BASIC UTILS ---
-def pdf_to_text(file_bytes: bytes) -> str:
+@st.cache_resource(show_spinner=False)
+def _executor():
+    # Shared across sessions for fire-and-forget sends (Twilio); the work is
+    # I/O-bound, so size for concurrent users rather than CPU cores
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=int(os.getenv("LUNA_BACKGROUND_WORKERS", "32")))
+
+def run_in_background(fn, *args, **kwargs):
+    """Submit fn to the shared executor. fn must not call Streamlit APIs."""
+    return _executor().submit(fn, *args, **kwargs)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def pdf_to_text(file) -> str:
+    # file is a Streamlit UploadedFile (a BytesIO); getvalue() hands PyMuPDF
+    # the existing buffer instead of reading it into a second bytes object
+    import fitz  # PyMuPDF; loaded on first upload, not at process start
     try:
-        reader = PdfReader(io.BytesIO(file_bytes))
-        pages = []
-        for p in reader.pages:
-            t = p.extract_text() or ""
-            pages.append(t)
+        doc = fitz.open(stream=file.getvalue(), filetype="pdf")
+        # Pages are read serially on purpose: MuPDF is not thread-safe, so a
+        # thread pool over one Document risks crashes, and reports are short
+        pages = [page.get_text("text") for page in doc]
+        doc.close()
         return "\n".join(pages)
     except Exception:
         return ""
 
-def extract_birads(text: str):
-    m = re.search(r"BI[-\s]?RADS?\s*[:\-]?\s*(\d)", text, re.IGNORECASE)
-    return int(m.group(1)) if m else None
-
-def extract_density(text: str):
-    patterns = [
-        (r"extremely dense|density\s*D\b", "D"),
-        (r"heterogeneously dense|density\s*C\b", "C"),
-        (r"scattered fibroglandular|density\s*B\b", "B"),
-        (r"almost entirely fatty|density\s*A\b", "A"),
-    ]
-    for pat, code in patterns:
-        if re.search(pat, text, re.IGNORECASE):
-            return code
-    return "unknown"
-
-def extract_laterality(text: str):
-    if re.search(r"bilateral|both breasts", text, re.IGNORECASE): return "bilateral"
-    if re.search(r"\bleft breast\b", text, re.IGNORECASE): return "left"
-    if re.search(r"\bright breast\b", text, re.IGNORECASE): return "right"
-    return "unknown"
+# --- RULE-BASED EXTRACTION ---
+# Fixed density/laterality phrases: (phrase, tag, needs word boundaries)
+_PHRASES = (
+    ("extremely dense", "dD", False),
+    ("heterogeneously dense", "dC", False),
+    ("scattered fibroglandular", "dB", False),
+    ("almost entirely fatty", "dA", False),
+    ("bilateral", "bilateral", False),
+    ("both breasts", "bilateral", False),
+    ("left breast", "left", True),
+    ("right breast", "right", True),
+)
+# The BI-RADS number and "density X" letters are not fixed phrases. RE2's \s,
+# \d and \b are ASCII-only, so the rest of the whitespace stdlib re's \s covers
+# (PDF text is full of U+00A0) is added as escapes, the word boundary after the
+# density letter is checked in extract_fields, and case-folding uses inline
+# (?i) since google-re2 takes no re-style flags. Results are then the same
+# whichever engine is installed.
+_EXTRA_SPACES = (0x0B, (0x1C, 0x1F), 0x85, 0xA0, 0x1680, (0x2000, 0x200A), 0x2028, 0x2029, 0x202F, 0x205F, 0x3000)
+_ESC = "\\x{%x}" if re2 is not re else "\\u%04x"  # RE2 and stdlib spell code points differently
+_SPACE_CHARS = "\\s" + "".join(
+    _ESC % cp if isinstance(cp, int) else f"{_ESC % cp[0]}-{_ESC % cp[1]}" for cp in _EXTRA_SPACES
+)
+# Separate patterns: a "density" match must never consume the start of a
+# following "BI-RADS" (e.g. "Breast Density\nBI-RADS 4")
+_BIRADS_RE = re2.compile(f"(?i)BI[-{_SPACE_CHARS}]?RADS?[{_SPACE_CHARS}]*[:\\-]?[{_SPACE_CHARS}]*([0-9])")
+_DENSITY_RE = re2.compile(f"(?i)density[{_SPACE_CHARS}]*([A-D])")
+# Tie-breaks when a report mentions several: highest density, bilateral first
+_DENSITY_ORDER = (("dD", "D"), ("dC", "C"), ("dB", "B"), ("dA", "A"))
+_LATERALITY_ORDER = ("bilateral", "left", "right")
+
+@st.cache_resource(show_spinner=False)
+def _phrase_automaton():
+    # Aho-Corasick automaton: finds every phrase in a single pass over the text
+    import ahocorasick
+    automaton = ahocorasick.Automaton()
+    for phrase, tag, bounded in _PHRASES:
+        automaton.add_word(phrase, (tag, len(phrase), bounded))
+    automaton.make_automaton()
+    return automaton
+
+def _is_word_char(text: str, i: int) -> bool:
+    return 0 <= i < len(text) and (text[i].isalnum() or text[i] == "_")
+
+def extract_fields(text: str) -> dict:
+    m = _BIRADS_RE.search(text)
+    birads = int(m.group(1)) if m else None
+    seen = set()
+    pos = 0
+    while (m := _DENSITY_RE.search(text, pos)):
+        if _is_word_char(text, m.end()):
+            # Not a density letter (e.g. "Density Dense"); rescan from the
+            # letter, which may itself start another "density"
+            pos = m.start(1)
+            continue
+        seen.add("d" + m.group(1).upper())
+        pos = m.end()
+    lower = text.lower()
+    for end, (tag, length, bounded) in _phrase_automaton().iter(lower):
+        if bounded and (_is_word_char(lower, end - length) or _is_word_char(lower, end + 1)):
+            continue
+        seen.add(tag)
+    density = next((code for tag, code in _DENSITY_ORDER if tag in seen), "unknown")
+    laterality = next((tag for tag in _LATERALITY_ORDER if tag in seen), "unknown")
+    return {"birads": birads, "density": density, "laterality": laterality}
+
+_BIRADS_DAYS = (7, 365, 365, 180, 7, 7, 0)  # follow-up days, indexed by BI-RADS 0-6
 
 def timeframe_from_birads(b):
-    if b is None: return None
-    return {0:7, 1:365, 2:365, 3:180, 4:7, 5:7, 6:0}.get(b)
+    # LLM output may not be an int, so guard before indexing
+    if not isinstance(b, int) or not 0 <= b < len(_BIRADS_DAYS): return None
+    return _BIRADS_DAYS[b]
 
 # --- LLM (optional) ---
+LLM_MODEL = "gpt-4o-mini"
+LLM_TEMPERATURE = 0.1
+LLM_CACHE_DIR = ".llm_cache"
+LLM_CACHE_TTL = 86400  # seconds
+SEMANTIC_CACHE_THRESHOLD = 0.92
+
+# Enforced server-side via structured outputs, so the prompt needs no schema dump.
+# The numbers are nullable so the model can say "not stated" instead of inventing
+# one; null and "unknown" never override the rule-based value in run_pipeline.
+LLM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "birads": {"type": ["integer", "null"], "description": "BI-RADS assessment category 0-6, or null if not stated"},
+        "density": {"type": "string", "enum": ["A", "B", "C", "D", "unknown"], "description": "Breast density category"},
+        "laterality": {"type": "string", "enum": ["left", "right", "bilateral", "unknown"], "description": "Side(s) examined"},
+        "findings": {"type": "string", "description": "Short plain-language summary of the findings"},
+        "recommendation": {"type": "string", "description": "Recommended next step as stated in the report"},
+        "recommended_timeframe_days": {"type": ["integer", "null"], "description": "Days until the recommended follow-up, or null if not stated"}
+    },
+    "required": ["birads","density","laterality","findings","recommendation","recommended_timeframe_days"],
+    "additionalProperties": False
+}
+# Static and first in the request, so OpenAI prompt caching can reuse it as a
+# prefix; only the user message (the report) varies between calls.
+LLM_SYSTEM_PROMPT = """You extract structured fields from mammogram reports.
+
+Rules:
+- Use only what the report states. If the BI-RADS category or the follow-up
+  interval is not stated, return null; never guess a number.
+- density: the ACR category (A almost entirely fatty, B scattered fibroglandular,
+  C heterogeneously dense, D extremely dense), or "unknown".
+- findings: one or two plain-language sentences.
+- recommendation: the next step as the report words it.
+
+Example report:
+Bilateral screening mammogram. The breasts are heterogeneously dense. No suspicious masses or calcifications. BI-RADS 1: Negative. Routine annual screening.
+Example answer:
+{"birads": 1, "density": "C", "laterality": "bilateral", "findings": "No suspicious masses or calcifications.", "recommendation": "Routine annual screening mammogram", "recommended_timeframe_days": 365}
+
+Example report:
+Left breast diagnostic mammogram. Scattered fibroglandular densities. 8 mm oval circumscribed mass at 2 o'clock, probably benign. BI-RADS 3. Short-interval follow-up in 6 months.
+Example answer:
+{"birads": 3, "density": "B", "laterality": "left", "findings": "8 mm oval circumscribed mass in the left breast, probably benign.", "recommendation": "Short-interval follow-up mammogram", "recommended_timeframe_days": 180}
+
+Example report:
+Right breast ultrasound correlation requested. Findings discussed with the referring clinician.
+Example answer:
+{"birads": null, "density": "unknown", "laterality": "right", "findings": "No findings are described in the report.", "recommendation": "Follow your clinician's advice", "recommended_timeframe_days": null}
+"""
+LLM_RESPONSE_FORMAT = {"type":"json_schema","json_schema":{"name":"mammo","schema":LLM_SCHEMA,"strict":True}}
+# Part of every cache key: changes whenever the prompt, schema or output format
+# does, so answers produced under an older prompt are never served
+LLM_PROMPT_FINGERPRINT = hashlib.sha256(
+    json.dumps([LLM_SYSTEM_PROMPT, LLM_RESPONSE_FORMAT], sort_keys=True).encode()
+).hexdigest()
+
+def config_flag(name: str) -> bool:
+    # An unset flag must not require a secrets.toml: st.secrets.get raises (and
+    # shows an st.error) when none exists, so only consult it if one was loaded
+    val = os.getenv(name)
+    if val is None and st.secrets.load_if_toml_exists():
+        val = st.secrets.get(name, None)
+    return str(val).strip().lower() in ("1", "true", "yes", "on")
+
+@st.cache_resource(show_spinner=False)
+def _exact_cache():
+    """On-disk cache of raw LLM responses keyed by request hash, or None."""
+    try:
+        import diskcache
+    except ImportError:
+        return None
+    return diskcache.Cache(os.path.join(LLM_CACHE_DIR, "exact"))
+
+@st.cache_resource(show_spinner=False)
+def _semantic_cache():
+    """Embedding model + FAISS index of past extractions, or None if deps are missing."""
+    try:
+        import faiss, pickle, threading
+        from sentence_transformers import SentenceTransformer
+    except ImportError:
+        return None
+    model = SentenceTransformer("all-MiniLM-L6-v2")
+    index_path = os.path.join(LLM_CACHE_DIR, "semantic.index")
+    entries_path = os.path.join(LLM_CACHE_DIR, "semantic.pkl")
+    if os.path.exists(index_path) and os.path.exists(entries_path):
+        index = faiss.read_index(index_path)
+        with open(entries_path, "rb") as f:
+            entries = pickle.load(f)
+    else:
+        index = faiss.IndexFlatIP(model.get_sentence_embedding_dimension())
+        entries = []
+    cache = {
+        "model": model, "index": index, "entries": entries, "lock": threading.Lock(),
+        "index_path": index_path, "entries_path": entries_path,
+    }
+    if _semantic_prune(cache):
+        _semantic_save(cache)
+    return cache
+
+def _semantic_live(entry, now: float) -> bool:
+    # Same lifetime as the exact cache, and only answers from the current prompt
+    return (
+        entry.get("prompt") == LLM_PROMPT_FINGERPRINT
+        and now - entry.get("stored_at", 0) < LLM_CACHE_TTL
+    )
+
+def _semantic_prune(cache) -> bool:
+    """Drop expired or stale-prompt entries and rebuild the index; True if any were dropped."""
+    import faiss, time
+    now = time.time()
+    keep = [i for i, entry in enumerate(cache["entries"]) if _semantic_live(entry, now)]
+    if len(keep) == len(cache["entries"]):
+        return False
+    index = faiss.IndexFlatIP(cache["index"].d)
+    if keep:
+        index.add(cache["index"].reconstruct_n(0, cache["index"].ntotal)[keep])
+    cache["index"] = index
+    cache["entries"] = [cache["entries"][i] for i in keep]
+    return True
+
+def _semantic_save(cache):
+    import faiss, pickle
+    os.makedirs(LLM_CACHE_DIR, exist_ok=True)
+    faiss.write_index(cache["index"], cache["index_path"])
+    with open(cache["entries_path"], "wb") as f:
+        pickle.dump(cache["entries"], f)
+
+def _semantic_lookup(cache, report_text: str):
+    import time
+    # Embeddings are normalized, so inner product == cosine similarity
+    emb = cache["model"].encode([report_text], normalize_embeddings=True)
+    with cache["lock"]:
+        if cache["index"].ntotal:
+            D, I = cache["index"].search(emb, 1)
+            entry = cache["entries"][I[0][0]]
+            if D[0][0] > SEMANTIC_CACHE_THRESHOLD and _semantic_live(entry, time.time()):
+                return emb, dict(entry["extraction"])
+    return emb, None
+
+def _semantic_store(cache, emb, extraction: dict):
+    import time
+    with cache["lock"]:
+        # Expired entries are removed here too, so they neither linger on disk
+        # nor shadow a live neighbour in later lookups
+        _semantic_prune(cache)
+        cache["index"].add(emb)
+        cache["entries"].append({
+            "prompt": LLM_PROMPT_FINGERPRINT, "stored_at": time.time(), "extraction": dict(extraction),
+        })
+        _semantic_save(cache)
+
 def llm_extract(report_text: str):
-    """Optional: enrich extraction with OpenAI. Returns dict or {}."""
+    """Optional: enrich extraction with OpenAI. Returns dict or {}.
+
+    Identical reports are answered from an on-disk cache. Set
+    LUNA_SEMANTIC_CACHE=1 to reuse answers for near-identical reports
+    (off by default: similar wording can still differ in clinically
+    important details).
+    """
     api_key = os.getenv("OPENAI_API_KEY") or st.secrets.get("OPENAI_API_KEY", None)
     if not api_key:
         return {}
+    use_semantic = config_flag("LUNA_SEMANTIC_CACHE")
     try:
+        import orjson
+        exact = _exact_cache()
+        key = hashlib.sha256(
+            f"{LLM_MODEL}|{LLM_TEMPERATURE}|{LLM_PROMPT_FINGERPRINT}|{report_text}".encode()
+        ).hexdigest()
+        hit = exact.get(key) if exact is not None else None
+        if hit is not None:
+            return orjson.loads(hit)
+        semantic = _semantic_cache() if use_semantic else None
+        if semantic:
+            emb, hit = _semantic_lookup(semantic, report_text)
+            if hit is not None:
+                return hit
         from openai import OpenAI
         client = OpenAI(api_key=api_key)
-        schema = {
-            "type": "object",
-            "properties": {
-                "birads": {"type": "integer"},
-                "density": {"type": "string"},
-                "laterality": {"type": "string"},
-                "findings": {"type": "string"},
-                "recommendation": {"type": "string"},
-                "recommended_timeframe_days": {"type": "integer"}
-            },
-            "required": ["birads","density","laterality","findings","recommendation","recommended_timeframe_days"]
-        }
-        user_prompt = f"""Extract the following from this mammogram report. 
-Return ONLY valid JSON matching this schema (no extra words):
-{schema}
-
-Report:
-{report_text}
-"""
         resp = client.chat.completions.create(
-            model="gpt-4o-mini",
+            model=LLM_MODEL,
             messages=[
-                {"role":"system","content":"You are a strict JSON extraction engine. Output valid JSON only."},
-                {"role":"user","content":user_prompt}
+                {"role":"system","content":LLM_SYSTEM_PROMPT},
+                {"role":"user","content":f"Report:\n{report_text}"}
             ],
-            temperature=0.1
+            temperature=LLM_TEMPERATURE,
+            response_format=LLM_RESPONSE_FORMAT
         )
-        import json
-        return json.loads(resp.choices[0].message.content)
+        content = resp.choices[0].message.content
+        result = orjson.loads(content)
+        if exact is not None:
+            exact.set(key, content, expire=LLM_CACHE_TTL)
+        if semantic:
+            _semantic_store(semantic, emb, result)
+        return result
     except Exception:
         return {}
 
@@ -115,17 +338,77 @@ def patient_summary(extraction: dict, language="en"):
 def calendar_link(title, start_date, details=""):
     # Create a Google Calendar "quick add" link
     # start_date = datetime.date
+    from urllib.parse import quote_plus
     start = start_date.strftime("%Y%m%d")
-    end = start_date.strftime("%Y%m%d")
-    params = {
-        "action": "TEMPLATE",
-        "text": title,
-        "dates": f"{start}/{end}",
-        "details": details,
+    return (
+        "https://calendar.google.com/calendar/render?action=TEMPLATE&text=" + quote_plus(title)
+        + f"&dates={start}/{start}&details=" + quote_plus(details)
+    )
+
+# --- PIPELINE ---
+@st.cache_data(show_spinner=False, ttl=3600, max_entries=32)
+def rule_pass(raw_text: str) -> dict:
+    """Rule-based extraction and readability grade; cached so reruns skip the scans."""
+    fields = extract_fields(raw_text)
+    extraction = {
+        **fields,
+        "findings": "",
+        "recommendation": "",
+        "recommended_timeframe_days": timeframe_from_birads(fields["birads"]),
+    }
+
+    # Basic readability proxy
+    words = len(raw_text.split())
+    sentences = max(1, raw_text.count(".")+raw_text.count("!")+raw_text.count("?"))
+    avg = words / sentences
+    grade = round(min(12, max(5, avg/2.0)), 1)
+
+    return {"extraction": extraction, "grade": grade}
+
+def run_pipeline(raw_text: str, language: str, use_llm: bool) -> dict:
+    """Extraction, summary and readability for one report.
+
+    The LLM merge is deliberately outside the cached rule pass: llm_extract
+    reports any failure as {}, which must not be cached, and its successful
+    answers are already cached on disk.
+    """
+    base = rule_pass(raw_text)
+    extraction = base["extraction"]
+
+    # Optional LLM enrichment
+    if use_llm:
+        llm = llm_extract(raw_text)
+        for k in extraction.keys():
+            if k in llm and llm[k] not in [None, "", "unknown"]:
+                extraction[k] = llm[k]
+        if extraction.get("recommended_timeframe_days") is None:
+            extraction["recommended_timeframe_days"] = timeframe_from_birads(extraction.get("birads"))
+
+    return {
+        "extraction": extraction,
+        "summary": patient_summary(extraction, language=language),
+        "grade": base["grade"],
     }
-    return "https://calendar.google.com/calendar/render?" + urllib.parse.urlencode(params)
 
 # --- UI ---
+LANGUAGES = {"en": "English (en)", "es": "Español (es)"}
+
+@st.fragment(run_every=1)
+def _sms_status():
+    # Re-runs on its own every second until the background send finishes, then
+    # stores the outcome and triggers a full rerun to show it and stop polling
+    future = st.session_state["sms_future"]
+    if not future.done():
+        st.info("Sending SMS reminder...")
+        return
+    del st.session_state["sms_future"]
+    try:
+        future.result()
+        st.session_state["sms_result"] = (True, "SMS sent!")
+    except Exception as e:
+        st.session_state["sms_result"] = (False, f"Twilio error: {e}")
+    st.rerun()
+
 st.set_page_config(page_title="Luna Breast", page_icon="🌙", layout="centered")
 st.title("Luna Breast")
 st.caption("Guidance for today. Confidence for tomorrow.")
@@ -136,8 +419,7 @@ col1, col2 = st.columns(2)
 with col1:
     file = st.file_uploader("Upload report PDF (optional)", type=["pdf"])
 with col2:
-    lang = st.selectbox("Language", ["English (en)", "Español (es)"])
-    language = "es" if "Español" in lang else "en"
+    language = st.selectbox("Language", list(LANGUAGES), format_func=LANGUAGES.get)
 
 text_input = st.text_area("...or paste report text here", height=200, placeholder="Paste mammogram report text...")
 
@@ -151,61 +433,43 @@ if st.button("Generate my summary", type="primary"):
 
     raw_text = text_input.strip()
     if file and file.name:
-        raw_text = pdf_to_text(file.read()) or raw_text
+        raw_text = pdf_to_text(file) or raw_text
 
     if not raw_text.strip():
         st.error("We could not read text from the PDF. Try pasting the report text.")
         st.stop()
 
-    # Base extraction
-    birads = extract_birads(raw_text)
-    density = extract_density(raw_text)
-    laterality = extract_laterality(raw_text)
-    timeframe = timeframe_from_birads(birads)
-    extraction = {
-        "birads": birads,
-        "density": density,
-        "laterality": laterality,
-        "findings": "",
-        "recommendation": "",
-        "recommended_timeframe_days": timeframe,
-    }
-
-    # Optional LLM enrichment
-    if use_llm:
-        llm = llm_extract(raw_text)
-        for k in extraction.keys():
-            if k in llm and llm[k] not in [None, ""]:
-                extraction[k] = llm[k]
-        if extraction.get("recommended_timeframe_days") is None:
-            extraction["recommended_timeframe_days"] = timeframe_from_birads(extraction.get("birads"))
+    result = run_pipeline(raw_text, language, use_llm)
+    extraction = result["extraction"]
 
     st.subheader("Your plain-language summary")
-    st.markdown(patient_summary(extraction, language=language))
-
-    # Basic readability proxy
-    words = len(raw_text.split())
-    sentences = max(1, raw_text.count(".")+raw_text.count("!")+raw_text.count("?"))
-    avg = words / sentences
-    grade = round(min(12, max(5, avg/2.0)), 1)
-    st.caption(f"Approx. reading grade of the original report: {grade}")
+    st.markdown(result["summary"])
+    st.caption(f"Approx. reading grade of the original report: {result['grade']}")
 
     with st.expander("View extracted fields"):
         st.json(extraction)
 
     # Gentle follow-up planner (no server/background jobs needed)
     tf = extraction.get("recommended_timeframe_days")
+    due = None
     if tf is not None and tf >= 0:
         due = datetime.date.today() + datetime.timedelta(days=int(tf))
         st.subheader("Plan your follow-up")
         st.write(f"**Suggested target date:** {due.isoformat()}")
         cal = calendar_link("Mammogram follow-up", due, "Luna Breast reminder: schedule or complete recommended follow-up.")
         st.link_button("📅 Add to Google Calendar", cal)
+    # Kept for the SMS section, which also runs on reruns where this button is False
+    st.session_state["follow_up_due"] = due.isoformat() if due else None
 
-    # Optional SMS via Twilio (no background jobs; just immediate send)
-    with st.expander("Optional: send a quick SMS reminder now (Twilio)"):
+# Optional SMS via Twilio. Lives outside the Generate branch so the rerun
+# caused by "Send SMS now" reaches it; the send runs on a worker thread and
+# _sms_status polls it until the outcome is known.
+if "follow_up_due" in st.session_state:
+    sms_result = st.session_state.pop("sms_result", None)
+    sms_busy = "sms_future" in st.session_state
+    with st.expander("Optional: send a quick SMS reminder now (Twilio)", expanded=sms_busy or sms_result is not None):
         phone = st.text_input("Phone (E.g., +12065551234)")
-        if st.button("Send SMS now"):
+        if st.button("Send SMS now", disabled=sms_busy):
             sid = os.getenv("TWILIO_ACCOUNT_SID") or st.secrets.get("TWILIO_ACCOUNT_SID", None)
             tok = os.getenv("TWILIO_AUTH_TOKEN") or st.secrets.get("TWILIO_AUTH_TOKEN", None)
             frm = os.getenv("TWILIO_FROM_NUMBER") or st.secrets.get("TWILIO_FROM_NUMBER", None)
@@ -215,11 +479,15 @@ if st.button("Generate my summary", type="primary"):
                 try:
                     from twilio.rest import Client
                     client = Client(sid, tok)
-                    msg = f"Hi from Luna Breast. Your target follow-up date is around {due.isoformat() if tf is not None else 'TBD'}."
-                    client.messages.create(body=msg, from_=frm, to=phone)
-                    st.success("SMS sent!")
+                    msg = f"Hi from Luna Breast. Your target follow-up date is around {st.session_state['follow_up_due'] or 'TBD'}."
+                    st.session_state["sms_future"] = run_in_background(client.messages.create, body=msg, from_=frm, to=phone)
                 except Exception as e:
                     st.error(f"Twilio error: {e}")
+        if sms_result is not None:
+            ok, text = sms_result
+            (st.success if ok else st.error)(text)
+        if "sms_future" in st.session_state:
+            _sms_status()
 
 st.write("---")
 st.caption("Educational guidance only. Not medical advice.")